@@ -1,303 +1,285 @@
-import json
+import orjson
+import sys
 import time
-import statistics
-from question_generator import QuestionGenerator
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from question_generator import MAX_CONCURRENT_REQUESTS, QuestionGenerator
+from typing import List, Dict, Callable
+
+
+_RULE = "=" * 70
+_THIN_RULE = "-" * 70
+
+# Fields that must be non-empty for a question to count towards the quality score
+_REQUIRED_FIELDS = {
+    "mcq": ("question", "correct_answer"),
+    "fillup": ("question", "correct_word", "hint"),
+    "coding": ("question", "input", "output", "constraints", "expected_output_example"),
+}
+
+
+def _has_four_options(q: Dict) -> bool:
+    """An MCQ needs exactly four non-empty options (all() alone passes an empty dict)"""
+    options = q.get("options")
+    return isinstance(options, dict) and len(options) == 4 and all(options.values())
+
+
+def _score(questions: List[Dict], qtype: str) -> float:
+    """Score quality (0-100) as the share of questions with every required field populated"""
+    if not questions:
+        return 0.0
+
+    fields = _REQUIRED_FIELDS[qtype]
+    check_options = qtype == "mcq"
+    quality_count = sum(
+        all(q.get(f) for f in fields) and (not check_options or _has_four_options(q))
+        for q in questions
+    )
+
+    return (quality_count / len(questions)) * 100
 
 
 class QuestionBenchmark:
     """Benchmark question generation performance"""
 
-    def __init__(self):
-        self.gen = QuestionGenerator()
+    def __init__(self, cache: bool = False, keep_questions: bool = True, verbose: bool = True,
+                 concurrent: bool = True):
+        self.gen = QuestionGenerator(cache=cache, verbose=verbose)
+        # Past the connection check, the generator's progress lines would print
+        # unlocked from the worker threads; each iteration's result (including
+        # any fallback to placeholder questions) is reported through _emit
+        self.gen.verbose = False
+        self.verbose = verbose
+        # Turn off for long runs that only need the summaries, not save_results
+        self.keep_questions = keep_questions
+        # Concurrent iterations queue on an Ollama that serves one request at a time,
+        # so each one's time includes that wait; run sequentially to measure latency
+        self.concurrent = concurrent
         self.results = {
             "mcq": [],
             "fillup": [],
             "coding": []
         }
+        self._counts = {"mcq": 0, "fillup": 0, "coding": 0}
+        self._lock = threading.Lock()
 
     def benchmark_mcq(self, topic: str = "AWS VPC", difficulty: str = "hard",
                       iterations: int = 3, count: int = 3) -> Dict:
         """Benchmark MCQ generation multiple times"""
-
-        print(f"\n{'=' * 70}")
-        print(f"BENCHMARKING MCQ: {iterations} iterations × {count} questions")
-        print(f"{'=' * 70}")
-
-        times = []
-        quality_scores = []
-
-        for i in range(iterations):
-            print(f"\n[Iteration {i + 1}/{iterations}]")
-            try:
-                questions, elapsed = self.gen.generate_mcq(topic, difficulty, count)
-                times.append(elapsed)
-
-                # Quality score: check if all fields are populated
-                quality = self._score_mcq_quality(questions)
-                quality_scores.append(quality)
-
-                print(f"  ⏱️  Time: {elapsed:.2f}s for {len(questions)} questions")
-                print(f"  📊 Quality: {quality:.1f}% (completeness)")
-                print(f"  ✅ Valid questions: {len(questions)}/{count}")
-
-                self.results["mcq"].extend(questions)
-
-            except Exception as e:
-                print(f"  ❌ Error: {e}")
-                continue
-
-        # Calculate statistics
-        if times:
-            avg_time = statistics.mean(times)
-            avg_quality = statistics.mean(quality_scores)
-            time_per_question = avg_time / count
-
-            summary = {
-                "type": "mcq",
-                "iterations": iterations,
-                "questions_per_iteration": count,
-                "total_questions": len(self.results["mcq"]),
-                "avg_time_seconds": round(avg_time, 2),
-                "avg_time_per_question": round(time_per_question, 2),
-                "min_time": round(min(times), 2),
-                "max_time": round(max(times), 2),
-                "avg_quality_percentage": round(avg_quality, 1)
-            }
-
-            self._print_benchmark_summary(summary)
-            return summary
-
-        return {}
+        return self._run_benchmark("mcq", "MCQ", self.gen.generate_mcq,
+                                   topic, difficulty, iterations, count)
 
     def benchmark_fillup(self, topic: str = "Data Transmission", difficulty: str = "hard",
                          iterations: int = 3, count: int = 3) -> Dict:
         """Benchmark Fill-up generation"""
-
-        print(f"\n{'=' * 70}")
-        print(f"BENCHMARKING FILL-UP: {iterations} iterations × {count} questions")
-        print(f"{'=' * 70}")
-
-        times = []
-        quality_scores = []
-
-        for i in range(iterations):
-            print(f"\n[Iteration {i + 1}/{iterations}]")
-            try:
-                questions, elapsed = self.gen.generate_fillup(topic, difficulty, count)
-                times.append(elapsed)
-
-                quality = self._score_fillup_quality(questions)
-                quality_scores.append(quality)
-
-                print(f"  ⏱️  Time: {elapsed:.2f}s for {len(questions)} questions")
-                print(f"  📊 Quality: {quality:.1f}% (completeness)")
-                print(f"  ✅ Valid questions: {len(questions)}/{count}")
-
-                self.results["fillup"].extend(questions)
-
-            except Exception as e:
-                print(f"  ❌ Error: {e}")
-                continue
-
-        if times:
-            avg_time = statistics.mean(times)
-            avg_quality = statistics.mean(quality_scores)
-            time_per_question = avg_time / count
-
-            summary = {
-                "type": "fillup",
-                "iterations": iterations,
-                "questions_per_iteration": count,
-                "total_questions": len(self.results["fillup"]),
-                "avg_time_seconds": round(avg_time, 2),
-                "avg_time_per_question": round(time_per_question, 2),
-                "min_time": round(min(times), 2),
-                "max_time": round(max(times), 2),
-                "avg_quality_percentage": round(avg_quality, 1)
-            }
-
-            self._print_benchmark_summary(summary)
-            return summary
-
-        return {}
+        return self._run_benchmark("fillup", "FILL-UP", self.gen.generate_fillup,
+                                   topic, difficulty, iterations, count)
 
     def benchmark_coding(self, topic: str = "Spring Boot Services", difficulty: str = "hard",
                          iterations: int = 3, count: int = 2) -> Dict:
         """Benchmark Coding generation"""
+        return self._run_benchmark("coding", "CODING", self.gen.generate_coding,
+                                   topic, difficulty, iterations, count)
+
+    def _run_benchmark(self, qtype: str, label: str, generate: Callable,
+                       topic: str, difficulty: str, iterations: int, count: int) -> Dict:
+        """Run the iterations (concurrently unless disabled) and summarise timings and quality"""
 
-        print(f"\n{'=' * 70}")
-        print(f"BENCHMARKING CODING: {iterations} iterations × {count} questions")
-        print(f"{'=' * 70}")
+        with self._lock:
+            self._emit(["", _RULE, f"BENCHMARKING {label}: {iterations} iterations × {count} questions", _RULE])
 
         times = []
         quality_scores = []
-
-        for i in range(iterations):
-            print(f"\n[Iteration {i + 1}/{iterations}]")
-            try:
-                questions, elapsed = self.gen.generate_coding(topic, difficulty, count)
-                times.append(elapsed)
-
-                quality = self._score_coding_quality(questions)
-                quality_scores.append(quality)
-
-                print(f"  ⏱️  Time: {elapsed:.2f}s for {len(questions)} questions")
-                print(f"  📊 Quality: {quality:.1f}% (completeness)")
-                print(f"  ✅ Valid questions: {len(questions)}/{count}")
-
-                self.results["coding"].extend(questions)
-
-            except Exception as e:
-                print(f"  ❌ Error: {e}")
-                continue
-
-        if times:
-            avg_time = statistics.mean(times)
-            avg_quality = statistics.mean(quality_scores)
+        cached_iterations = 0
+        fallback_iterations = 0
+
+        # Each iteration is an independent blocking Ollama call, so submit them all up
+        # front, with no more threads than the session has pooled connections
+        workers = max(1, min(iterations, MAX_CONCURRENT_REQUESTS)) if self.concurrent else 1
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self._generate_with_flag, generate, topic, difficulty, count): i
+                       for i in range(iterations)}
+
+            for future in as_completed(futures):
+                # Buffer the iteration's output so concurrent suites don't interleave lines
+                log = [f"\n[{label} iteration {futures[future] + 1}/{iterations}]"]
+                questions = []
+                try:
+                    questions, elapsed, cached, fallback = future.result()
+                    if cached:
+                        cached_iterations += 1
+                    else:
+                        times.append(elapsed)
+
+                    # Quality score: check if all fields are populated
+                    quality = _score(questions, qtype)
+                    quality_scores.append(quality)
+
+                    log.append(f"  ⏱️  Time: {elapsed:.2f}s for {len(questions)} questions"
+                               f"{' (cached)' if cached else ''}")
+                    log.append(f"  📊 Quality: {quality:.1f}% (completeness)")
+                    log.append(f"  ✅ Valid questions: {len(questions)}/{count}")
+                    if fallback:
+                        fallback_iterations += 1
+                        log.append("  ⚠️  Fallback placeholders: the model output couldn't be parsed")
+
+                except Exception as e:
+                    log.append(f"  ❌ Error: {e}")
+
+                with self._lock:
+                    self._counts[qtype] += len(questions)
+                    if self.keep_questions:
+                        self.results[qtype].extend(questions)
+                    self._emit(log)
+
+        wall_time = time.perf_counter() - wall_start
+
+        # Calculate statistics; cache hits say nothing about generation speed,
+        # so the timing figures only cover iterations that actually called Ollama
+        if quality_scores:
+            times = times or [0.0]
+
+            # One pass for mean/min/max rather than a traversal per statistic
+            t_min = t_max = times[0]
+            t_sum = 0.0
+            for t in times:
+                if t < t_min:
+                    t_min = t
+                elif t > t_max:
+                    t_max = t
+                t_sum += t
+
+            avg_time = t_sum / len(times)
+            avg_quality = sum(quality_scores) / len(quality_scores)
             time_per_question = avg_time / count
 
             summary = {
-                "type": "coding",
+                "type": qtype,
                 "iterations": iterations,
                 "questions_per_iteration": count,
-                "total_questions": len(self.results["coding"]),
+                "total_questions": self._counts[qtype],
                 "avg_time_seconds": round(avg_time, 2),
                 "avg_time_per_question": round(time_per_question, 2),
-                "min_time": round(min(times), 2),
-                "max_time": round(max(times), 2),
-                "avg_quality_percentage": round(avg_quality, 1)
+                "min_time": round(t_min, 2),
+                "max_time": round(t_max, 2),
+                "avg_quality_percentage": round(avg_quality, 1),
+                "cached_iterations": cached_iterations,
+                "fallback_iterations": fallback_iterations,
+                "wall_time_seconds": round(wall_time, 2),
+                "concurrent": self.concurrent
             }
 
-            self._print_benchmark_summary(summary)
+            with self._lock:
+                self._print_benchmark_summary(summary)
             return summary
 
         return {}
 
+    def _generate_with_flag(self, generate: Callable, topic: str, difficulty: str, count: int) -> tuple:
+        """Call a generate_* method and report whether it was a cache hit or a fallback"""
+        questions, elapsed = generate(topic, difficulty, count)
+        return questions, elapsed, self.gen.last_cached, self.gen.last_fallback
+
     def benchmark_all(self, mcq_iter=2, fillup_iter=2, coding_iter=2):
         """Run complete benchmark suite"""
 
-        print("\n" + "🏃 STARTING COMPLETE BENCHMARK SUITE 🏃".center(70, "="))
+        self._emit(["", "🏃 STARTING COMPLETE BENCHMARK SUITE 🏃".center(70, "=")])
 
-        results = {
-            "mcq": self.benchmark_mcq(iterations=mcq_iter, count=1),
-            "fillup": self.benchmark_fillup(iterations=fillup_iter, count=1),
-            "coding": self.benchmark_coding(iterations=coding_iter, count=2)
-        }
+        # The three suites are independent, so let them share the Ollama server concurrently
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            f_mcq = pool.submit(self.benchmark_mcq, iterations=mcq_iter, count=1)
+            f_fillup = pool.submit(self.benchmark_fillup, iterations=fillup_iter, count=1)
+            f_coding = pool.submit(self.benchmark_coding, iterations=coding_iter, count=2)
+
+            results = {
+                "mcq": f_mcq.result(),
+                "fillup": f_fillup.result(),
+                "coding": f_coding.result()
+            }
 
         self._print_final_summary(results)
 
         return results
 
-    def _score_mcq_quality(self, questions: List[Dict]) -> float:
-        """Score MCQ quality (0-100)"""
-        if not questions:
-            return 0.0
-
-        quality_count = 0
-        for q in questions:
-            # Check if all critical fields exist and are non-empty
-            has_question = bool(q.get("question"))
-            has_options = all(q.get("options", {}).values())
-            has_answer = bool(q.get("correct_answer"))
-
-            if has_question and has_options and has_answer:
-                quality_count += 1
-
-        return (quality_count / len(questions)) * 100
-
-    def _score_fillup_quality(self, questions: List[Dict]) -> float:
-        """Score Fill-up quality (0-100)"""
-        if not questions:
-            return 0.0
-
-        quality_count = 0
-        for q in questions:
-            has_question = bool(q.get("question"))
-            has_answer = bool(q.get("correct_word"))
-            has_hint = bool(q.get("hint"))
-
-            if has_question and has_answer and has_hint:
-                quality_count += 1
-
-        return (quality_count / len(questions)) * 100
-
-    def _score_coding_quality(self, questions: List[Dict]) -> float:
-        """Score Coding quality (0–100) based on schema completeness"""
-
-        if not questions:
-            return 0.0
-
-        quality_count = 0
-
-        for q in questions:
-            has_question = bool(q.get("question"))
-            has_input = bool(q.get("input"))
-            has_output = bool(q.get("output"))
-            has_constraints = bool(q.get("constraints"))
-            has_example = bool(q.get("expected_output_example"))
-
-            if (
-                    has_question and
-                    has_input and
-                    has_output and
-                    has_constraints and
-                    has_example
-            ):
-                quality_count += 1
-
-        return (quality_count / len(questions)) * 100
+    def _emit(self, lines: List[str]):
+        """Write a block of output in one call (callers hold the lock when running concurrently)"""
+        if self.verbose:
+            sys.stdout.write("\n".join(lines) + "\n")
 
     def _print_benchmark_summary(self, summary: Dict):
         """Print formatted benchmark summary"""
-        print("\n" + "-" * 70)
-        print(f"SUMMARY: {summary['type'].upper()}")
-        print("-" * 70)
-        print(f"  Total Valid Questions: {summary['total_questions']}")
-        print(f"  Average Time/Iteration: {summary['avg_time_seconds']}s")
-        print(f"  Average Time/Question: {summary['avg_time_per_question']}s")
-        print(f"  Time Range: {summary['min_time']}s - {summary['max_time']}s")
-        print(f"  Quality Score: {summary['avg_quality_percentage']}%")
-        print("-" * 70)
+        lines = [
+            "",
+            _THIN_RULE,
+            f"SUMMARY: {summary['type'].upper()}",
+            _THIN_RULE,
+            f"  Total Valid Questions: {summary['total_questions']}",
+            f"  Average Time/Iteration: {summary['avg_time_seconds']}s",
+            f"  Average Time/Question: {summary['avg_time_per_question']}s",
+            f"  Time Range: {summary['min_time']}s - {summary['max_time']}s",
+            f"  Suite Wall Time: {summary['wall_time_seconds']}s",
+            f"  Quality Score: {summary['avg_quality_percentage']}%",
+        ]
+        if summary["concurrent"]:
+            lines.append("  (Iterations ran concurrently; per-iteration times include queueing)")
+        if summary["cached_iterations"]:
+            lines.append(f"  Cached Iterations: {summary['cached_iterations']} (excluded from timings)")
+        if summary["fallback_iterations"]:
+            lines.append(f"  ⚠️  Fallback Iterations: {summary['fallback_iterations']} (placeholder questions)")
+        lines.append(_THIN_RULE)
+        self._emit(lines)
 
     def _print_final_summary(self, results: Dict):
         """Print final overall summary"""
-        print("\n" + "=" * 70)
-        print("FINAL BENCHMARK SUMMARY")
-        print("=" * 70)
-
         total_questions = (results["mcq"].get("total_questions", 0) +
                            results["fillup"].get("total_questions", 0) +
                            results["coding"].get("total_questions", 0))
 
-        print(f"\n📊 OVERALL STATISTICS:")
-        print(f"  Total Questions Generated: {total_questions}")
+        lines = [
+            "",
+            _RULE,
+            "FINAL BENCHMARK SUMMARY",
+            _RULE,
+            "",
+            "📊 OVERALL STATISTICS:",
+            f"  Total Questions Generated: {total_questions}",
+        ]
 
         for qtype, result in results.items():
             if result:
-                print(f"\n  {qtype.upper()}:")
-                print(f"    ✅ Questions: {result['total_questions']}")
-                print(f"    ⏱️  Avg Time: {result['avg_time_per_question']}s/question")
-                print(f"    📈 Quality: {result['avg_quality_percentage']}%")
+                lines.extend([
+                    "",
+                    f"  {qtype.upper()}:",
+                    f"    ✅ Questions: {result['total_questions']}",
+                    f"    ⏱️  Avg Time: {result['avg_time_per_question']}s/question",
+                    f"    📈 Quality: {result['avg_quality_percentage']}%",
+                ])
 
-        print("\n" + "=" * 70)
+        lines.extend(["", _RULE])
+        self._emit(lines)
 
     def save_results(self, filename: str = "benchmark_results.json"):
         """Save all generated questions to JSON for analysis"""
-        with open(filename, 'w') as f:
-            json.dump(self.results, f, indent=2)
-        print(f"\n💾 Results saved to {filename}")
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
+        self._emit(["", f"💾 Results saved to {filename}"])
 
 
 # Run benchmark
 if __name__ == "__main__":
     benchmark = QuestionBenchmark()
 
-    # Option 1: Benchmark each type separately
+    # Option 1: Benchmark each type separately, concurrently over the shared keep-alive session
     print("\n🔍 INDIVIDUAL BENCHMARKS\n")
-    benchmark.benchmark_mcq(iterations=2, count=1)
-    benchmark.benchmark_fillup(iterations=2, count=1)
-    # benchmark.benchmark_coding(iterations=2, count=2)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [
+            pool.submit(benchmark.benchmark_mcq, iterations=2, count=1),
+            pool.submit(benchmark.benchmark_fillup, iterations=2, count=1),
+            # pool.submit(benchmark.benchmark_coding, iterations=2, count=2),
+        ]
+        for future in futures:
+            future.result()
 
     # Option 2: Save all results
     benchmark.save_results("generated_questions.json")
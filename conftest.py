@@ -0,0 +1,63 @@
+import hashlib
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import orjson
+import pytest
+import question_generator
+from question_generator import QuestionGenerator
+
+_CACHE_DIR = Path(".qgen_cache")
+
+# Cached questions are only valid for the model and parsing code that produced
+# them, so both go into the key; editing question_generator.py starts afresh
+_MODEL = inspect.signature(QuestionGenerator).parameters["model"].default
+_SOURCE_HASH = hashlib.sha1(Path(question_generator.__file__).read_bytes()).hexdigest()
+
+# Building a generator checks the connection to Ollama; start that while pytest
+# is still collecting so the first test that needs one doesn't wait on it
+_GEN_POOL = ThreadPoolExecutor(max_workers=1)
+_GEN_FUTURE = _GEN_POOL.submit(QuestionGenerator)
+_GEN_POOL.shutdown(wait=False)
+
+
+@pytest.fixture(scope="session")
+def gen() -> QuestionGenerator:
+    """One generator (and HTTP session) shared by every test in the worker"""
+    return _GEN_FUTURE.result()
+
+
+@pytest.fixture(scope="session")
+def cached_questions(request):
+    """Generate questions, reusing ones saved on disk by an earlier run (QGEN_NOCACHE=1 to skip)
+
+    Entries are one JSON file each, replaced atomically, so pytest-xdist workers
+    can share the cache. Only a miss waits for the generator, and fallback
+    placeholders are never written.
+    """
+
+    def generate(kind: str, topic: str, difficulty: str, count: int) -> list:
+        if os.environ.get("QGEN_NOCACHE") == "1":
+            questions, _ = getattr(request.getfixturevalue("gen"), f"generate_{kind}")(topic, difficulty, count)
+            return questions
+
+        key = hashlib.sha1(f"{_MODEL}|{_SOURCE_HASH}|{kind}|{topic}|{difficulty}|{count}".encode()).hexdigest()
+        path = _CACHE_DIR / f"{key}.json"
+        if path.exists():
+            return orjson.loads(path.read_bytes())
+
+        gen = request.getfixturevalue("gen")
+        questions, _ = getattr(gen, f"generate_{kind}")(topic, difficulty, count)
+        # Placeholders from unparseable output would otherwise pass every later run
+        if gen.last_fallback:
+            return questions
+
+        _CACHE_DIR.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(orjson.dumps(questions))
+        os.replace(tmp, path)
+        return questions
+
+    return generate
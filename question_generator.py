@@ -1,9 +1,17 @@
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import re
+import copy
+import functools
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
 from enum import Enum
 
 
@@ -19,33 +27,8 @@ class QuestionType(Enum):
     CODING = "coding"
 
 
-class QuestionGenerator:
-    """Generate quiz questions using Mistral 7B via Ollama - FIXED VERSION"""
-
-    def __init__(self, ollama_url: str = "http://localhost:11434"):
-        """Initialize the question generator"""
-        self.ollama_url = ollama_url
-        self.model = "gemma3:4b"
-        self.temperature = 0.3  # FIXED: Lowered from 0.7 for consistent JSON output
-        self.test_connection()
-
-    def test_connection(self) -> bool:
-        """Test if Ollama server is running"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                print("✅ Connected to Ollama server")
-                print(f"✅ Model '{self.model}' is available")
-                return True
-        except requests.exceptions.ConnectionError:
-            print("❌ Cannot connect to Ollama server")
-            print("   Start with: ollama serve")
-            raise
-
-    def generate_mcq(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
-        """Generate MCQ questions - FIXED"""
-
-        prompt = f"""You are an expert exam question designer.
+# Prompt templates are filled with format_map(topic=, difficulty=, count=); JSON braces are doubled
+_MCQ_PROMPT = """You are an expert exam question designer.
 
 TASK:
 Generate exactly {count} MULTIPLE CHOICE QUESTIONS on the topic "{topic}" with difficulty "{difficulty}".
@@ -106,21 +89,8 @@ Return ONLY the JSON array.
 Generate exactly {count} questions.
 """
 
-        print(f"\n🔄 Generating {count} MCQ questions...")
-        print(f"   Topic: {topic}, Difficulty: {difficulty}")
-        start_time = time.time()
-        raw_output = self._call_ollama(prompt)
-        elapsed = time.time() - start_time
-
-        questions = self._parse_mcq(raw_output, topic, difficulty, count)
-
-        print(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s")
-        return questions, elapsed
-
-    def generate_fillup(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
-        """Generate fill-in-the-blank questions - FIXED"""
 
-        prompt =f"""You are an expert academic question designer.
+_FILLUP_PROMPT = """You are an expert academic question designer.
 
 TASK:
 Generate exactly {count} FILL-IN-THE-BLANK questions on the topic "{topic}" with difficulty "{difficulty}".
@@ -168,22 +138,8 @@ FINAL INSTRUCTION:
 Generate exactly {count} unique questions. Return ONLY the JSON array.
 """
 
-        print(f"\n🔄 Generating {count} Fill-up questions...")
-        print(f"   Topic: {topic}, Difficulty: {difficulty}")
 
-        start_time = time.time()
-        raw_output = self._call_ollama(prompt)
-        elapsed = time.time() - start_time
-
-        questions = self._parse_fillup(raw_output, topic, difficulty, count)
-
-        print(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s")
-        return questions, elapsed
-
-    def generate_coding(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
-        """Generate coding challenge questions"""
-
-        prompt = f"""You are an expert programming question setter for technical interviews and exams.
+_CODING_PROMPT = """You are an expert programming question setter for technical interviews and exams.
 
     TASK:
     Generate {count} CODING questions for the topic "{topic}" with difficulty "{difficulty}".
@@ -231,84 +187,347 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
     Now generate {count} coding questions.
     """
 
-        print(f"\n🔄 Generating {count} Coding questions...")
-        print(f"   Topic: {topic}, Difficulty: {difficulty}")
+
+# Output token budget per request: (tokens per question, fixed overhead)
+_OUTPUT_TOKEN_BUDGET = {
+    "mcq": (220, 200),
+    "fillup": (120, 150),
+    "coding": (350, 200),
+}
+
+# Keep-alive connections in the session pool; callers running requests in threads
+# should stay within it, since urllib3 discards connections past this many
+MAX_CONCURRENT_REQUESTS = 16
+
+_FALLBACK_OPTIONS = ("A", "B", "C", "D")
+_FALLBACK_EXPLANATION = "This is a fallback question. Please regenerate for better quality."
+_FALLBACK_TIME_LIMITS = {"easy": 120, "medium": 180, "hard": 300}
+
+_RE_FENCE = re.compile(r'```(?:json)?\s*')
+_RE_JSON_TOKEN = re.compile(r'[\[\]{}"\\]')
+_RE_JSON_START = re.compile(r'[\[{]')
+_JSON_DECODER = json.JSONDecoder()
+
+
+class _JsonScanner:
+    """Track bracket depth across chunks of text, ignoring brackets inside JSON strings"""
+
+    def __init__(self):
+        self.start = -1  # offset of the first '[' or '{'
+        self.end = -1  # offset just past its matching close bracket
+        self._offset = 0
+        self._depth = 0
+        self._in_string = False
+        self._skip = -1  # offset of a character escaped by a backslash
+
+    def feed(self, chunk: str) -> bool:
+        """Scan the next chunk; return True once the first JSON value is closed"""
+        if self.end >= 0:
+            return True
+
+        for match in _RE_JSON_TOKEN.finditer(chunk):
+            pos = self._offset + match.start()
+            ch = match.group()
+            if pos == self._skip:
+                continue
+
+            if self._in_string:
+                if ch == "\\":
+                    self._skip = pos + 1
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                # Quotes before the JSON starts are just prose
+                self._in_string = self.start >= 0
+            elif ch in "[{":
+                if self.start < 0:
+                    self.start = pos
+                self._depth += 1
+            elif self.start >= 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = pos + 1
+                    break
+
+        self._offset += len(chunk)
+        return self.end >= 0
+
+
+@functools.lru_cache(maxsize=256)
+def _extract_and_parse(raw_output: str):
+    """Extract and decode the JSON in a response, memoised on the raw text
+
+    Low-temperature runs often return byte-identical output. The decoded
+    object is shared between hits, so callers must deep-copy it before use.
+    """
+    # Remove markdown code blocks
+    raw_output = _RE_FENCE.sub('', raw_output)
+
+    # Decode the first JSON array or object and ignore any prose after it;
+    # raw_decode runs in C and stops at the end of that value
+    match = _RE_JSON_START.search(raw_output)
+    return _JSON_DECODER.raw_decode(raw_output, match.start() if match else 0)[0]
+
+
+class QuestionGenerator:
+    """Generate quiz questions using Mistral 7B via Ollama - FIXED VERSION"""
+
+    def __init__(self, ollama_url: str = "http://localhost:11434", model: str = "gemma3:4b",
+                 fan_out: bool = False, cache: bool = False, verbose: bool = True):
+        """Initialize the question generator
+
+        model: Ollama tag to generate with. "gemma3:4b" is already the 4-bit q4_K_M
+        build, the fastest option since decoding is memory-bandwidth bound; use
+        "gemma3:4b-it-q8_0" or "gemma3:4b-it-fp16" to trade speed for quality.
+
+        fan_out: request each question with its own single-question prompt, all in
+        parallel, instead of one long completion for the whole batch. Faster when
+        Ollama serves concurrent requests, but the model can't see its sibling
+        questions, so repeats become more likely.
+
+        cache: reuse the questions from an earlier (or still running) call with the
+        same model, type, topic, difficulty and count instead of asking Ollama again.
+
+        verbose: print progress and warnings. Turn off when the caller reports
+        results itself, e.g. from worker threads that would interleave with it.
+        """
+        self.ollama_url = ollama_url
+        self.model = model
+        self.temperature = 0.3  # FIXED: Lowered from 0.7 for consistent JSON output
+        self.fan_out = fan_out
+        self.cache = cache
+        self.verbose = verbose
+        # One Future per key, so concurrent callers asking for the same questions
+        # wait on a single Ollama call instead of all missing together
+        self._cache: Dict[bytes, Future] = {}
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+
+        # One keep-alive pool shared by every call (and by benchmark worker threads)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(
+            pool_connections=MAX_CONCURRENT_REQUESTS,
+            pool_maxsize=MAX_CONCURRENT_REQUESTS,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        ))
+        self._request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+        self.test_connection()
+
+    @property
+    def last_cached(self) -> bool:
+        """Whether this thread's most recent generate_* call was served from the cache"""
+        return getattr(self._local, "cached", False)
+
+    @property
+    def last_fallback(self) -> bool:
+        """Whether this thread's most recent generate_* call returned placeholder questions"""
+        return getattr(self._local, "fallback", False)
+
+    def _log(self, *lines: str):
+        """Print progress lines unless the generator is quiet"""
+        if self.verbose:
+            print(*lines, sep="\n")
+
+    def test_connection(self) -> bool:
+        """Test if Ollama server is running"""
+        try:
+            response = self.session.get(f"{self.ollama_url}/api/tags", timeout=5)
+            if response.status_code == 200:
+                self._log("✅ Connected to Ollama server")
+                # Tags without a version are stored as ":latest"
+                pulled = {m.get("name") for m in orjson.loads(response.content).get("models", [])}
+                if self.model in pulled or f"{self.model}:latest" in pulled:
+                    self._log(f"✅ Model '{self.model}' is available")
+                else:
+                    self._log(f"⚠️  Model '{self.model}' not found - pull it with: ollama pull {self.model}")
+                return True
+        except requests.exceptions.ConnectionError:
+            print("❌ Cannot connect to Ollama server")
+            print("   Start with: ollama serve")
+            raise
+
+    def generate_mcq(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
+        """Generate MCQ questions - FIXED"""
+
+        prompt_count = 1 if self.fan_out else count
+        prompt = _MCQ_PROMPT.format_map({"topic": topic, "difficulty": difficulty, "count": prompt_count})
+
+        self._log(f"\n🔄 Generating {count} MCQ questions...", f"   Topic: {topic}, Difficulty: {difficulty}")
+        start_time = time.time()
+        questions = self._generate_questions("mcq", prompt, self._parse_mcq, topic, difficulty, count)
+        elapsed = time.time() - start_time
+
+        self._log(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s{' (cached)' if self.last_cached else ''}")
+        return questions, elapsed
+
+    def generate_fillup(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
+        """Generate fill-in-the-blank questions - FIXED"""
+
+        prompt_count = 1 if self.fan_out else count
+        prompt = _FILLUP_PROMPT.format_map({"topic": topic, "difficulty": difficulty, "count": prompt_count})
+
+        self._log(f"\n🔄 Generating {count} Fill-up questions...", f"   Topic: {topic}, Difficulty: {difficulty}")
 
         start_time = time.time()
-        raw_output = self._call_ollama(prompt)
+        questions = self._generate_questions("fillup", prompt, self._parse_fillup, topic, difficulty, count)
         elapsed = time.time() - start_time
 
-        questions = self._parse_coding(raw_output, topic, difficulty, count)
+        self._log(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s{' (cached)' if self.last_cached else ''}")
+        return questions, elapsed
+
+    def generate_coding(self, topic: str, difficulty: str = "easy", count: int = 3) -> tuple:
+        """Generate coding challenge questions"""
+
+        prompt_count = 1 if self.fan_out else count
+        prompt = _CODING_PROMPT.format_map({"topic": topic, "difficulty": difficulty, "count": prompt_count})
+
+        self._log(f"\n🔄 Generating {count} Coding questions...", f"   Topic: {topic}, Difficulty: {difficulty}")
 
-        print(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s")
+        start_time = time.time()
+        questions = self._generate_questions("coding", prompt, self._parse_coding, topic, difficulty, count)
+        elapsed = time.time() - start_time
+
+        self._log(f"✅ Generated {len(questions)} questions in {elapsed:.2f}s{' (cached)' if self.last_cached else ''}")
         return questions, elapsed
 
-    def _call_ollama(self, prompt: str) -> str:
+    def _generate_questions(self, qtype: str, prompt: str, parse: Callable, topic: str,
+                            difficulty: str, count: int) -> List[Dict]:
+        """Serve from the cache, or call Ollama once for the batch (once per question in fan-out mode)"""
+        self._local.fallback = False
+        if not self.cache:
+            self._local.cached = False
+            return self._request_questions(qtype, prompt, parse, topic, difficulty, count)
+
+        key = self._cache_key(qtype, topic, difficulty, count)
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._cache[key] = Future()
+
+        # Anyone but the first caller for a key waits for its result
+        self._local.cached = not owner
+        if not owner:
+            questions, self._local.fallback = entry.result()
+            return copy.deepcopy(questions)
+
+        try:
+            questions = self._request_questions(qtype, prompt, parse, topic, difficulty, count)
+        except BaseException as e:
+            # Don't cache failures; the next call for this key tries again
+            with self._cache_lock:
+                del self._cache[key]
+            entry.set_exception(e)
+            raise
+
+        # Placeholder questions count as a failure too: callers already waiting
+        # share them, but the key is dropped so the next call asks Ollama again
+        if self.last_fallback:
+            with self._cache_lock:
+                del self._cache[key]
+        entry.set_result((copy.deepcopy(questions), self.last_fallback))
+        return questions
+
+    def _request_questions(self, qtype: str, prompt: str, parse: Callable, topic: str,
+                           difficulty: str, count: int) -> List[Dict]:
+        """Call Ollama once for the batch, or once per question in fan-out mode"""
+        per_question, overhead = _OUTPUT_TOKEN_BUDGET[qtype]
+        if not self.fan_out or count <= 1:
+            max_out_tokens = per_question * count + overhead
+            questions = parse(self._call_ollama(prompt, max_out_tokens), topic, difficulty, count)
+        else:
+            max_out_tokens = per_question + overhead
+            with ThreadPoolExecutor(max_workers=min(count, MAX_CONCURRENT_REQUESTS)) as pool:
+                raw_outputs = list(pool.map(self._call_ollama, [prompt] * count, [max_out_tokens] * count))
+
+            questions = []
+            for raw_output in raw_outputs:
+                questions.extend(parse(raw_output, topic, difficulty, 1))
+
+            # Each single-question response numbers itself 1, so renumber the batch
+            for i, q in enumerate(questions, 1):
+                q["id"] = i
+
+        return questions
+
+    def _cache_key(self, qtype: str, topic: str, difficulty: str, count: int) -> bytes:
+        """Hash a request so that case and whitespace variants of a topic share an entry"""
+        topic = " ".join(topic.split()).casefold()
+        difficulty = difficulty.strip().casefold()
+        return hashlib.sha1(f"{self.model}|{topic}|{difficulty}|{qtype}|{count}".encode()).digest()
+
+    def _call_ollama(self, prompt: str, max_out_tokens: int) -> str:
         """Call Ollama API and get response"""
+        # Ollama reloads the model whenever num_ctx changes, so stay on the 2048
+        # window unless the prompt (~3 chars/token) plus output would not fit
+        needed_ctx = len(prompt) // 3 + max_out_tokens
+        num_ctx = max(2048, -(-needed_ctx // 1024) * 1024)
+
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "temperature": self.temperature,
-                    "top_p": 0.9,  # Added for more consistent outputs
-                    "top_k": 40,  # Added for better quality
-                },
-                # timeout=120
-            )
-
-            if response.status_code != 200:
-                print(f"❌ Ollama error: {response.status_code}")
-                raise Exception(f"Ollama returned {response.status_code}")
-
-            return response.json().get("response", "")
+            # Hold a pool slot until the response is closed, so extra threads wait
+            # here rather than overflowing the session's keep-alive pool
+            with self._request_slots:
+                response = self.session.post(
+                    f"{self.ollama_url}/api/generate",
+                    json={
+                        "model": self.model,
+                        "prompt": prompt,
+                        "stream": True,
+                        # Sampling settings are only honoured inside "options"
+                        "options": {
+                            "temperature": self.temperature,
+                            "top_p": 0.9,  # Added for more consistent outputs
+                            "top_k": 40,  # Added for better quality
+                            "num_ctx": num_ctx,  # A smaller KV cache decodes faster
+                            "num_predict": max_out_tokens,  # Stop the model rambling past the JSON
+                            "stop": ["\n\n\n"],
+                        },
+                    },
+                    stream=True,
+                    # timeout=120
+                )
+
+                with response:
+                    if response.status_code != 200:
+                        self._log(f"❌ Ollama error: {response.status_code}")
+                        raise Exception(f"Ollama returned {response.status_code}")
+
+                    # Stop reading as soon as the JSON value is complete; closing the
+                    # response tells Ollama to abandon any trailing chatter
+                    chunks = []
+                    scanner = _JsonScanner()
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = orjson.loads(line)
+                        if "error" in data:
+                            raise Exception(f"Ollama error: {data['error']}")
+                        chunk = data.get("response", "")
+                        chunks.append(chunk)
+                        if scanner.feed(chunk) or data.get("done"):
+                            break
+
+                return "".join(chunks)
 
         except requests.exceptions.Timeout:
-            print("❌ Timeout - model taking too long")
+            self._log("❌ Timeout - model taking too long")
             raise
         except Exception as e:
-            print(f"❌ Error: {e}")
+            self._log(f"❌ Error: {e}")
             raise
 
-    def _extract_json(self, raw_output: str) -> str:
-        """Extract JSON from various formats - ROBUST"""
-        # Remove markdown code blocks
-        raw_output = re.sub(r'```json\s*', '', raw_output)
-        raw_output = re.sub(r'```\s*', '', raw_output)
-
-        # Try to find JSON array or object
-        json_match = re.search(r'(\[.*\]|\{.*\})', raw_output, re.DOTALL)
-        if json_match:
-            return json_match.group(1)
-
-        return raw_output.strip()
-
     def _parse_mcq(self, raw_output: str, topic: str, difficulty: str, count: int) -> List[Dict]:
         """Parse MCQ JSON format - ROBUST with fallback"""
 
-        # Extract JSON
-        cleaned = self._extract_json(raw_output)
-
         try:
-            parsed = json.loads(cleaned)
+            parsed = copy.deepcopy(_extract_and_parse(raw_output))
             if isinstance(parsed, list):
                 # Validate and fix each question
                 valid_questions = []
                 for i, q in enumerate(parsed, 1):
                     if isinstance(q, dict):
                         # Ensure required fields
-                        validated = {
-                            "id": q.get("id", i),
-                            "topic": q.get("topic", topic),
-                            "difficulty": q.get("difficulty", difficulty),
-                            "type": "mcq",
-                            "question": q.get("question", ""),
-                            "options": q.get("options", {}),
-                            "correct_answer": q.get("correct_answer", "A"),
-                            "explanation": q.get("explanation", "")
-                        }
+                        validated = self._validate_mcq(q, i, topic, difficulty)
                         # Only add if has question and options
                         if validated["question"] and validated["options"]:
                             valid_questions.append(validated)
@@ -318,48 +537,28 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
 
             elif isinstance(parsed, dict):
                 # Single question
-                validated = {
-                    "id": parsed.get("id", 1),
-                    "topic": parsed.get("topic", topic),
-                    "difficulty": parsed.get("difficulty", difficulty),
-                    "type": "mcq",
-                    "question": parsed.get("question", ""),
-                    "options": parsed.get("options", {}),
-                    "correct_answer": parsed.get("correct_answer", "A"),
-                    "explanation": parsed.get("explanation", "")
-                }
+                validated = self._validate_mcq(parsed, 1, topic, difficulty)
                 if validated["question"] and validated["options"]:
                     return [validated]
 
         except json.JSONDecodeError as e:
-            print(f"⚠️  JSON parse failed: {e}")
-            print(f"⚠️  Raw output: {raw_output[:200]}...")
+            self._log(f"⚠️  JSON parse failed: {e}", f"⚠️  Raw output: {raw_output[:200]}...")
 
         # Fallback: Generate basic questions
-        print("⚠️  Using fallback generation")
+        self._log("⚠️  Using fallback generation")
+        self._local.fallback = True
         return self._generate_fallback_mcq(topic, difficulty, count)
 
     def _parse_fillup(self, raw_output: str, topic: str, difficulty: str, count: int) -> List[Dict]:
         """Parse fill-up JSON format - ROBUST with fallback"""
 
-        cleaned = self._extract_json(raw_output)
-
         try:
-            parsed = json.loads(cleaned)
+            parsed = copy.deepcopy(_extract_and_parse(raw_output))
             if isinstance(parsed, list):
                 valid_questions = []
                 for i, q in enumerate(parsed, 1):
                     if isinstance(q, dict):
-                        validated = {
-                            "id": q.get("id", i),
-                            "topic": q.get("topic", topic),
-                            "difficulty": q.get("difficulty", difficulty),
-                            "type": "fillup",
-                            "question": q.get("question", ""),
-                            "correct_word": q.get("correct_word", ""),
-                            "hint": q.get("hint", ""),
-                            "explanation": q.get("explanation", "")
-                        }
+                        validated = self._validate_fillup(q, i, topic, difficulty)
                         if validated["question"] and validated["correct_word"]:
                             valid_questions.append(validated)
 
@@ -367,32 +566,22 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
                     return valid_questions
 
             elif isinstance(parsed, dict):
-                validated = {
-                    "id": parsed.get("id", 1),
-                    "topic": parsed.get("topic", topic),
-                    "difficulty": parsed.get("difficulty", difficulty),
-                    "type": "fillup",
-                    "question": parsed.get("question", ""),
-                    "correct_word": parsed.get("correct_word", ""),
-                    "hint": parsed.get("hint", ""),
-                    "explanation": parsed.get("explanation", "")
-                }
+                validated = self._validate_fillup(parsed, 1, topic, difficulty)
                 if validated["question"] and validated["correct_word"]:
                     return [validated]
 
         except json.JSONDecodeError as e:
-            print(f"⚠️  JSON parse failed: {e}")
+            self._log(f"⚠️  JSON parse failed: {e}")
 
-        print("⚠️  Using fallback generation")
+        self._log("⚠️  Using fallback generation")
+        self._local.fallback = True
         return self._generate_fallback_fillup(topic, difficulty, count)
 
     def _parse_coding(self, raw_output: str, topic: str, difficulty: str, count: int) -> List[Dict]:
         """Parse Coding JSON format - ROBUST, SCHEMA-ALIGNED"""
 
-        cleaned = self._extract_json(raw_output)
-
         try:
-            parsed = json.loads(cleaned)
+            parsed = copy.deepcopy(_extract_and_parse(raw_output))
 
             if isinstance(parsed, dict):
                 parsed = [parsed]  # normalize single object to list
@@ -406,18 +595,7 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
                 if not isinstance(q, dict):
                     continue
 
-                validated = {
-                    "id": q.get("id", i),
-                    "topic": q.get("topic", topic),
-                    "difficulty": q.get("difficulty", difficulty),
-                    "type": "coding",
-                    "question": q.get("question", "").strip(),
-                    "input": q.get("input", "").strip(),
-                    "output": q.get("output", "").strip(),
-                    "constraints": q.get("constraints", "").strip(),
-                    "expected_output_example": q.get("expected_output_example", "").strip(),
-                    "time_limit_seconds": q.get("time_limit_seconds", 120),
-                }
+                validated = self._validate_coding(q, i, topic, difficulty)
 
                 # Minimal validation (DO NOT over-restrict)
                 if validated["question"] and validated["input"] and validated["output"]:
@@ -427,11 +605,95 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
                 return valid_questions[:count]
 
         except (json.JSONDecodeError, ValueError) as e:
-            print(f"⚠️ Coding JSON parse failed: {e}")
+            self._log(f"⚠️ Coding JSON parse failed: {e}")
 
-        print("⚠️ Using fallback generation for coding questions")
+        self._log("⚠️ Using fallback generation for coding questions")
+        self._local.fallback = True
         return self._generate_fallback_coding(topic, difficulty, count)
 
+    # The _validate_* helpers index the schema fields directly, which is the common
+    # case when the model follows the prompt, and only fall back to per-field
+    # defaults when a key is missing
+
+    def _validate_mcq(self, q: Dict, i: int, topic: str, difficulty: str) -> Dict:
+        """Normalise one parsed MCQ to the output schema"""
+        try:
+            return {
+                "id": q["id"],
+                "topic": q["topic"],
+                "difficulty": q["difficulty"],
+                "type": "mcq",
+                "question": q["question"],
+                "options": q["options"],
+                "correct_answer": q["correct_answer"],
+                "explanation": q.get("explanation", "")
+            }
+        except KeyError:
+            return {
+                "id": q.get("id", i),
+                "topic": q.get("topic", topic),
+                "difficulty": q.get("difficulty", difficulty),
+                "type": "mcq",
+                "question": q.get("question", ""),
+                "options": q.get("options", {}),
+                "correct_answer": q.get("correct_answer", "A"),
+                "explanation": q.get("explanation", "")
+            }
+
+    def _validate_fillup(self, q: Dict, i: int, topic: str, difficulty: str) -> Dict:
+        """Normalise one parsed fill-up question to the output schema"""
+        try:
+            return {
+                "id": q["id"],
+                "topic": q["topic"],
+                "difficulty": q["difficulty"],
+                "type": "fillup",
+                "question": q["question"],
+                "correct_word": q["correct_word"],
+                "hint": q["hint"],
+                "explanation": q.get("explanation", "")
+            }
+        except KeyError:
+            return {
+                "id": q.get("id", i),
+                "topic": q.get("topic", topic),
+                "difficulty": q.get("difficulty", difficulty),
+                "type": "fillup",
+                "question": q.get("question", ""),
+                "correct_word": q.get("correct_word", ""),
+                "hint": q.get("hint", ""),
+                "explanation": q.get("explanation", "")
+            }
+
+    def _validate_coding(self, q: Dict, i: int, topic: str, difficulty: str) -> Dict:
+        """Normalise one parsed coding question to the output schema"""
+        try:
+            return {
+                "id": q["id"],
+                "topic": q["topic"],
+                "difficulty": q["difficulty"],
+                "type": "coding",
+                "question": q["question"].strip(),
+                "input": q["input"].strip(),
+                "output": q["output"].strip(),
+                "constraints": q["constraints"].strip(),
+                "expected_output_example": q["expected_output_example"].strip(),
+                "time_limit_seconds": q.get("time_limit_seconds", 120),
+            }
+        except KeyError:
+            return {
+                "id": q.get("id", i),
+                "topic": q.get("topic", topic),
+                "difficulty": q.get("difficulty", difficulty),
+                "type": "coding",
+                "question": q.get("question", "").strip(),
+                "input": q.get("input", "").strip(),
+                "output": q.get("output", "").strip(),
+                "constraints": q.get("constraints", "").strip(),
+                "expected_output_example": q.get("expected_output_example", "").strip(),
+                "time_limit_seconds": q.get("time_limit_seconds", 120),
+            }
+
     def _generate_fallback_mcq(self, topic: str, difficulty: str, count: int) -> List[Dict]:
         """Generate basic MCQ questions when model fails"""
         return [{
@@ -440,14 +702,9 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
             "difficulty": difficulty,
             "type": "mcq",
             "question": f"What is an important concept in {topic}? (Question {i + 1})",
-            "options": {
-                "A": "Option A",
-                "B": "Option B",
-                "C": "Option C",
-                "D": "Option D"
-            },
+            "options": {k: f"Option {k}" for k in _FALLBACK_OPTIONS},
             "correct_answer": "A",
-            "explanation": "This is a fallback question. Please regenerate for better quality."
+            "explanation": _FALLBACK_EXPLANATION
         } for i in range(count)]
 
     def _generate_fallback_fillup(self, topic: str, difficulty: str, count: int) -> List[Dict]:
@@ -460,12 +717,12 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
             "question": f"In {topic}, ___ is an important concept (Question {i + 1})",
             "correct_word": "placeholder",
             "hint": "Key concept",
-            "explanation": "This is a fallback question. Please regenerate for better quality."
+            "explanation": _FALLBACK_EXPLANATION
         } for i in range(count)]
 
     def _generate_fallback_coding(self, topic: str, difficulty: str, count: int) -> List[Dict]:
         """Generate basic coding questions when model fails"""
-        time_limits = {"easy": 120, "medium": 180, "hard": 300}
+        time_limit = _FALLBACK_TIME_LIMITS.get(difficulty, 120)
         return [{
             "id": i + 1,
             "topic": topic,
@@ -475,7 +732,7 @@ Generate exactly {count} unique questions. Return ONLY the JSON array.
             "function_name": f"solve_{i + 1}",
             "test_input": "input",
             "expected_output": "output",
-            "time_limit_seconds": time_limits.get(difficulty, 120)
+            "time_limit_seconds": time_limit
         } for i in range(count)]
 
 
@@ -1,151 +1,281 @@
-import json
-from question_generator import QuestionGenerator
+# Run with pytest; the tests are independent, so `pytest -n 5 test_generation.py`
+# (pytest-xdist) runs them in parallel. Shared fixtures live in conftest.py.
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
+import orjson
+import pytest
+from benchmark_generation import _score
+from question_generator import QuestionGenerator, _JsonScanner
 
-def test_mcq_generation():
+_BANNER = "=" * 60
+
+
+def _timed(fn, *args):
+    """Call fn and return its result with the wall and CPU seconds it took
+
+    CPU time is this thread's own, so calls timed side by side don't count
+    each other's work (process_time would).
+    """
+    start, cpu_start = time.perf_counter_ns(), time.thread_time_ns()
+    result = fn(*args)
+    return result, (time.perf_counter_ns() - start) / 1e9, (time.thread_time_ns() - cpu_start) / 1e9
+
+
+def _print_header(title: str):
+    """Print a test's banner block in one write"""
+    sys.stdout.write(f"\n{_BANNER}\n{title}\n{_BANNER}\n")
+
+
+def test_mcq_generation(cached_questions):
     """Test MCQ question generation"""
-    print("\n" + "=" * 60)
-    print("TEST 1: MCQ Question Generation")
-    print("=" * 60)
+    _print_header("TEST 1: MCQ Question Generation")
 
-    gen = QuestionGenerator()
-    questions = gen.generate_mcq(
-        topic="Python Basics",
-        difficulty="easy",
-        count=3
-    )
+    questions = cached_questions("mcq", topic="Python Basics", difficulty="easy", count=3)
 
     print(f"\nGenerated {len(questions)} questions")
-    for q in questions:
-        print(f"\n  Q{q['id']}: {q['question']}")
-        print(f"  Options: {list(q['options'].values())}")
-        print(f"  Answer: {q['correct_answer']}")
+    sys.stdout.write("".join(
+        f"\n  Q{qid}: {text}\n"
+        f"  Options: {', '.join(map(str, options.values()))}\n"
+        f"  Answer: {answer}\n"
+        for qid, text, options, answer in map(itemgetter('id', 'question', 'options', 'correct_answer'), questions)
+    ))
 
     assert len(questions) > 0, "No questions generated!"
-    assert all(q['type'] == 'mcq' for q in questions)
+    assert set(map(itemgetter('type'), questions)) == {'mcq'}
     print("✅ TEST PASSED")
 
 
-def test_fillup_generation():
+def test_fillup_generation(cached_questions):
     """Test fill-up question generation"""
-    print("\n" + "=" * 60)
-    print("TEST 2: Fill-up Question Generation")
-    print("=" * 60)
+    _print_header("TEST 2: Fill-up Question Generation")
 
-    gen = QuestionGenerator()
-    questions = gen.generate_fillup(
-        topic="SQL",
-        difficulty="medium",
-        count=2
-    )
+    questions = cached_questions("fillup", topic="SQL", difficulty="medium", count=2)
 
     print(f"\nGenerated {len(questions)} questions")
-    for q in questions:
-        print(f"\n  Q{q['id']}: {q['question']}")
-        print(f"  Answer: {q['correct_word']}")
-        print(f"  Hint: {q['hint']}")
+    sys.stdout.write("".join(
+        f"\n  Q{qid}: {text}\n"
+        f"  Answer: {word}\n"
+        f"  Hint: {hint}\n"
+        for qid, text, word, hint in map(itemgetter('id', 'question', 'correct_word', 'hint'), questions)
+    ))
 
     assert len(questions) > 0, "No questions generated!"
-    assert all(q['type'] == 'fillup' for q in questions)
+    assert set(map(itemgetter('type'), questions)) == {'fillup'}
     print("✅ TEST PASSED")
 
 
-def test_coding_generation():
+def test_coding_generation(cached_questions):
     """Test coding question generation"""
-    print("\n" + "=" * 60)
-    print("TEST 3: Coding Challenge Generation")
-    print("=" * 60)
+    _print_header("TEST 3: Coding Challenge Generation")
 
-    gen = QuestionGenerator()
-    questions = gen.generate_coding(
-        topic="Python Algorithms",
-        difficulty="medium",
-        count=2
-    )
+    questions = cached_questions("coding", topic="Python Algorithms", difficulty="medium", count=2)
 
     print(f"\nGenerated {len(questions)} questions")
-    for q in questions:
-        print(f"\n  Q{q['id']}: {q['question']}")
-        print(f"  Function: {q['function_name']}")
-        print(f"  Test Input: {q['test_input']}")
-        print(f"  Expected: {q['expected_output']}")
+    sys.stdout.write("".join(
+        f"\n  Q{q['id']}: {q['question']}\n"
+        f"  Input: {q.get('input')}\n"
+        f"  Output: {q.get('output')}\n"
+        f"  Expected: {q.get('expected_output_example')}\n"
+        for q in questions
+    ))
 
     assert len(questions) > 0, "No questions generated!"
-    assert all(q['type'] == 'coding' for q in questions)
+    assert set(map(itemgetter('type'), questions)) == {'coding'}
     print("✅ TEST PASSED")
 
 
-def test_json_validity():
+def test_json_validity(cached_questions):
     """Test that output is valid JSON"""
-    print("\n" + "=" * 60)
-    print("TEST 4: JSON Validity")
-    print("=" * 60)
+    _print_header("TEST 4: JSON Validity")
 
-    gen = QuestionGenerator()
-    questions = gen.generate_mcq(
-        topic="Python",
-        difficulty="easy",
-        count=2
-    )
+    questions = cached_questions("mcq", topic="Python", difficulty="easy", count=2)
 
     try:
-        json_str = json.dumps(questions)
-        parsed = json.loads(json_str)
-        print(f"\n✅ Generated valid JSON ({len(json_str)} bytes)")
+        # orjson only ever emits valid JSON and raises on anything it can't encode,
+        # so a successful dumps is the whole check. Non-str keys (e.g. an int-keyed
+        # options map) are stringified the way json.dumps would, not rejected.
+        json_bytes = orjson.dumps(questions, option=orjson.OPT_NON_STR_KEYS)
+        print(f"\n✅ Generated valid JSON ({len(json_bytes)} bytes)")
         print("✅ TEST PASSED")
-    except json.JSONDecodeError as e:
+    except orjson.JSONEncodeError as e:
         print(f"❌ Invalid JSON: {e}")
         raise
 
 
-def test_performance():
+def test_performance(gen):
     """Benchmark question generation speed"""
-    print("\n" + "=" * 60)
-    print("TEST 5: Performance Benchmark")
-    print("=" * 60)
+    _print_header("TEST 5: Performance Benchmark")
 
-    import time
+    # The three generations are independent, so issue them together and time each one
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        f_mcq = pool.submit(_timed, gen.generate_mcq, "Python", "easy", 5)
+        f_fillup = pool.submit(_timed, gen.generate_fillup, "SQL", "medium", 5)
+        f_coding = pool.submit(_timed, gen.generate_coding, "Python", "easy", 3)
 
-    gen = QuestionGenerator()
+        mcq, mcq_time, mcq_cpu = f_mcq.result()
+        fillup, fillup_time, fillup_cpu = f_fillup.result()
+        coding, coding_time, coding_cpu = f_coding.result()
 
+    # Wall time is mostly waiting on the model; cpu is the Python-side work
     # Test MCQ
-    start = time.time()
-    mcq = gen.generate_mcq("Python", "easy", 5)
-    mcq_time = time.time() - start
-    print(f"\n5 MCQ questions: {mcq_time:.2f} seconds")
+    print(f"\n5 MCQ questions: wall={mcq_time:.2f}s cpu={mcq_cpu:.3f}s")
     print(f"Average per question: {mcq_time / 5:.2f} seconds")
 
     # Test Fill-up
-    start = time.time()
-    fillup = gen.generate_fillup("SQL", "medium", 5)
-    fillup_time = time.time() - start
-    print(f"\n5 Fill-up questions: {fillup_time:.2f} seconds")
+    print(f"\n5 Fill-up questions: wall={fillup_time:.2f}s cpu={fillup_cpu:.3f}s")
     print(f"Average per question: {fillup_time / 5:.2f} seconds")
 
     # Test Coding
-    start = time.time()
-    coding = gen.generate_coding("Python", "easy", 3)
-    coding_time = time.time() - start
-    print(f"\n3 Coding questions: {coding_time:.2f} seconds")
+    print(f"\n3 Coding questions: wall={coding_time:.2f}s cpu={coding_cpu:.3f}s")
     print(f"Average per question: {coding_time / 3:.2f} seconds")
 
     print("\n✅ TEST PASSED")
 
 
-if __name__ == "__main__":
-    try:
-        test_mcq_generation()
-        test_fillup_generation()
-        test_coding_generation()
-        test_json_validity()
-        test_performance()
+# The tests below exercise pure helpers and don't need an Ollama server
+
+def _scan(*chunks: str):
+    """Feed chunks to a fresh _JsonScanner; return it, the joined text and whether it closed"""
+    scanner = _JsonScanner()
+    closed = False
+    for chunk in chunks:
+        closed = scanner.feed(chunk)
+    return scanner, "".join(chunks), closed
+
+
+def test_scanner_ignores_brackets_in_strings():
+    """Brackets inside JSON strings don't change the depth"""
+    scanner, text, closed = _scan('[{"question": "Is ] or } a closer? [x]"}]')
+
+    assert closed
+    assert text[scanner.start:scanner.end] == text
+
+
+def test_scanner_handles_escaped_quotes():
+    """An escaped quote doesn't end the string it's in"""
+    scanner, text, closed = _scan('{"code": "print(\\"]\\")", "id": 1}')
+
+    assert closed
+    assert orjson.loads(text[scanner.start:scanner.end]) == {"code": 'print("]")', "id": 1}
+
+
+def test_scanner_handles_escape_split_across_chunks():
+    """A backslash at the end of one chunk still escapes the first character of the next"""
+    scanner, text, closed = _scan('{"q": "a \\', '"] b", "id": 1}', ' trailing } ]')
+
+    assert closed
+    assert orjson.loads(text[scanner.start:scanner.end]) == {"q": 'a "] b', "id": 1}
+
+
+def test_scanner_skips_prose_around_json():
+    """Quotes before the JSON are prose, and anything after the closing bracket is ignored"""
+    scanner, text, closed = _scan('Sure, here are your "questions":\n[{"id": 1}]\nHope this helps! [extra]')
+
+    assert closed
+    assert text[scanner.start:scanner.end] == '[{"id": 1}]'
+
+
+def test_scanner_unterminated_value():
+    """A value that never closes is reported as still open"""
+    scanner, _, closed = _scan('[{"id": 1, "question": "open ]', '"}')
+
+    assert not closed
+    assert scanner.end == -1
+
+
+
+def _offline_generator() -> QuestionGenerator:
+    """A caching generator built without __init__, so no Ollama connection is made"""
+    gen = object.__new__(QuestionGenerator)
+    gen.model = "test-model"
+    gen.cache = True
+    gen.verbose = False
+    gen._cache = {}
+    gen._cache_lock = threading.Lock()
+    gen._local = threading.local()
+    return gen
+
+
+def test_cache_shares_one_call_between_concurrent_callers():
+    """Callers asking for a key that is still being generated wait for that call"""
+    gen = _offline_generator()
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def request(*args):
+        calls.append(args)
+        entered.set()
+        release.wait(5)
+        return [{"id": 1, "question": "Q?"}]
+
+    gen._request_questions = request
+
+    def generate():
+        questions = gen._generate_questions("mcq", "prompt", None, "Python", "easy", 1)
+        return questions, gen.last_cached
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        first = pool.submit(generate)
+        assert entered.wait(5)
+        # The key now holds a pending Future, so these two can only wait on it
+        others = [pool.submit(generate) for _ in range(2)]
+        release.set()
+        results = [first.result()] + [f.result() for f in others]
+
+    assert len(calls) == 1
+    assert [cached for _, cached in results] == [False, True, True]
+    assert all(questions == [{"id": 1, "question": "Q?"}] for questions, _ in results)
+    # Every caller gets its own copy
+    assert results[1][0] is not results[2][0]
+
+
+def test_cache_drops_failed_and_fallback_results():
+    """A raised error or placeholder questions aren't cached; the next call retries"""
+    gen = _offline_generator()
+    outcomes = iter(["error", "fallback", "ok"])
+
+    def request(*args):
+        outcome = next(outcomes)
+        if outcome == "error":
+            raise RuntimeError("Ollama returned 500")
+        gen._local.fallback = outcome == "fallback"
+        return [{"id": 1, "question": outcome}]
+
+    gen._request_questions = request
+
+    with pytest.raises(RuntimeError):
+        gen._generate_questions("mcq", "prompt", None, "Python", "easy", 1)
+    assert not gen._cache
+
+    questions = gen._generate_questions("mcq", "prompt", None, "Python", "easy", 1)
+    assert questions[0]["question"] == "fallback" and gen.last_fallback
+    assert not gen._cache
+
+    questions = gen._generate_questions("mcq", "prompt", None, "Python", "easy", 1)
+    assert questions[0]["question"] == "ok" and not gen.last_cached
+    questions = gen._generate_questions("mcq", "prompt", None, "Python", "easy", 1)
+    assert questions[0]["question"] == "ok" and gen.last_cached
+
+
+def test_cache_key_normalises_topic_and_difficulty():
+    """Case and whitespace variants share a key; type and count don't"""
+    gen = _offline_generator()
+    key = gen._cache_key("mcq", "AWS VPC", "hard", 2)
 
-        print("\n" + "=" * 60)
-        print("✅ ALL TESTS PASSED!")
-        print("=" * 60)
+    assert gen._cache_key("mcq", "  aws   vpc ", " HARD", 2) == key
+    assert gen._cache_key("mcq", "AWS VPC", "hard", 3) != key
+    assert gen._cache_key("fillup", "AWS VPC", "hard", 2) != key
 
-    except Exception as e:
-        print(f"\n❌ TEST FAILED: {e}")
-        import traceback
+def test_score_requires_four_non_empty_options():
+    """MCQ quality only counts questions with exactly four non-empty options"""
+    base = {"question": "Q?", "correct_answer": "A"}
+    four = {"A": "a", "B": "b", "C": "c", "D": "d"}
 
-        traceback.print_exc()
\ No newline at end of file
+    assert _score([dict(base, options={})], "mcq") == 0.0
+    assert _score([dict(base, options={"A": "a", "B": "b", "C": "c"})], "mcq") == 0.0
+    assert _score([dict(base, options=dict(four, D=""))], "mcq") == 0.0
+    assert _score([dict(base, options=four)], "mcq") == 100.0